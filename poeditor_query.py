@@ -2,15 +2,27 @@
 
 import argparse
 import ast
+import asyncio
+import concurrent.futures
 import datetime
+import functools
+import hashlib
+import json
 import logging
 import os
 try:
     import pathlib
 except ImportError:
     import pathlib2 as pathlib
-from subprocess import check_call
+import shutil
+import subprocess
 import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 file_path = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
 
@@ -21,11 +33,97 @@ log = logging.getLogger("query")
 log.addHandler(logging.StreamHandler())
 log.setLevel(logging.DEBUG)
 
+# Maximum number of languages synced with poeditor.com at the same time
+MAX_CONCURRENT_REQUESTS = 10
+
+# Blocking poeditor.com api calls run on their own pool, sized like the http connection pool.
+_api_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS,
+                                                      thread_name_prefix="poeditor")
+
+
+# poeditor.com accepts one file upload at a time, and every upload syncs the terms of the whole project.
+# So uploads run one after the other on their own single thread.
+_upload_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="poeditor-upload")
+
+
+async def _call_api(func, *args, executor=_api_executor, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+CACHE_PATH = pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache") / "poeditor_query"
+
+# Number of seconds the cached list of languages of a project can be used by --status
+SERVER_LANGUAGES_CACHE_TIMEOUT = 300
+
+
+# The answers of these queries do not change while this script runs.
+# The lock avoids that concurrent syncs all query the server before the first answer is cached.
+_cache_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_server_to_name_map(api):
+    server_to_name = {}
+    for name, server in api.available_languages().items():
+        server_to_name.setdefault(server, name)
+    return server_to_name
+
+
+def server_to_name_map(api):
+    with _cache_lock:
+        return _cached_server_to_name_map(api)
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_list_projects(api):
+    return api.list_projects()
+
+
+class _SessionRequests:
+    # Stand-in for the requests module that sends all requests through one session,
+    # so connections to poeditor.com are kept alive and reused.
+    SESSION_METHODS = ("request", "get", "post", "put", "patch", "delete", "head", "options")
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        if name in self.SESSION_METHODS:
+            return getattr(self._session, name)
+        return getattr(requests, name)
+
+
+def share_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=MAX_CONCURRENT_REQUESTS, pool_maxsize=MAX_CONCURRENT_REQUESTS,
+                          max_retries=Retry(total=3, backoff_factor=0.3))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    sys.modules[poeditor.POEditorAPI.__module__].requests = _SessionRequests(session)
+    return session
+
+
+def _norm_local(code):
+    return code.replace("-", "_").lower()
+
+
+def _norm_server(code):
+    return code.replace("_", "-").lower()
+
+
+def _norm_codes(codes):
+    return frozenset(norm for code in codes for norm in (_norm_local(code), _norm_server(code)))
+
 
 class Mapping:
     def __init__(self):
         self._local = None
+        self._local_norm = None
         self._server = None
+        self._server_norm = None
+        self._aliases = frozenset()
+        self._keys = frozenset()
         self._name = None
         self._server_completed = None
         self._server_updated = None
@@ -38,6 +136,8 @@ class Mapping:
 
     def set_local(self, local):
         self._local = local
+        self._local_norm = _norm_local(local) if local else None
+        self._update_keys()
 
     @classmethod
     def create_server(cls, server, name):
@@ -47,35 +147,33 @@ class Mapping:
 
     def set_server(self, server, name, server_completed=None, server_updated=None):
         self._server = server
+        self._server_norm = _norm_server(server) if server else None
+        self._update_keys()
         self._name = name
         self._server_completed = server_completed
         self._server_updated = server_updated
 
-    def matches_code(self, code):
-        if self.local():
-            if self.local().lower() == code.replace("-", "_").lower():
-                return True
-        if self.server():
-            if self.server().lower() == code.replace("_", "-").lower():
-                return True
-        return False
+    def add_aliases(self, codes):
+        self._aliases |= _norm_codes(codes)
+        self._update_keys()
+
+    def _update_keys(self):
+        # Normalized codes this mapping answers to
+        self._keys = frozenset(key for key in (self._local_norm, self._server_norm) if key) | self._aliases
 
     def local(self):
         return self._local
 
-    def _local_to_server(self, fixes):
-        for local, server in fixes.items():
-            if local == self.local() or server == self.local():
-                return server
-        return self.local().replace("_", "-").lower()
+    def _local_to_server(self, fixes_local_to_server):
+        return fixes_local_to_server.get(self.local()) or self.local().replace("_", "-").lower()
 
     def server(self):
         return self._server
 
-    def _server_to_local(self, fixes):
-        for local, server in fixes.items():
-            if local == self.server() or server == self.server():
-                return local
+    def _server_to_local(self, fixes_server_to_local):
+        local = fixes_server_to_local.get(self.server())
+        if local:
+            return local
         parts = self.server().split("-")
         parts = parts[:1] + [part.upper() for part in parts[1:]]
         return "_".join(parts)
@@ -89,244 +187,355 @@ class Mapping:
     def updated(self):
         return self._server_updated
 
-    def sync_from_server(self, api, project_id, project_name, root_path, fixes, download_path):
+    def _server_to_local_po_path(self, project_name, root_path, fixes_server_to_local):
+        local = self._server_to_local(fixes_server_to_local=fixes_server_to_local)
+        return (root_path / local / project_name).with_suffix(".po")
+
+    def is_synced_from_server(self, project_name, root_path, fixes_server_to_local):
+        # After a sync, the modification time of the local po file is set to the server update time.
+        if not self.server() or not self._server_updated:
+            return False
+        local_po_path = self._server_to_local_po_path(project_name=project_name, root_path=root_path,
+                                                      fixes_server_to_local=fixes_server_to_local)
+        try:
+            return local_po_path.stat().st_mtime == self._server_updated.timestamp()
+        except FileNotFoundError:
+            return False
+
+    async def sync_from_server(self, server_po_file, project_name, root_path, fixes_server_to_local, download_path):
         log.debug("Mapping.sync_from_server(server={server}) ...".format(server=self.server()))
         if not self.server():
             log.error("Cannot sync from server if language is not on server")
             return False
-        log.debug("Fetching translations from server ...")
-        server_po_url, server_po_file = api.export(project_id=project_id, language_code=self.server(),
-                                          file_type="po")
-        log.debug("... Translations fetched!")
+        if server_po_file is None:
+            log.error("Translations of {server} were not fetched from server".format(server=self.server()))
+            return False
 
         server_po_path = pathlib.Path(server_po_file)
 
         if download_path:
-            download_path.mkdir(exist_ok=True)
+            await asyncio.to_thread(download_path.mkdir, exist_ok=True)
             copy_path = download_path / "poeditor_{server}.po".format(server=self.server())
-            copy_path.write_bytes(server_po_path.read_bytes())
+            await asyncio.to_thread(shutil.copyfile, str(server_po_path), str(copy_path))
 
-        local = self._server_to_local(fixes=fixes)
-        local_po_path = (root_path / local / project_name).with_suffix(".po")
+        local = self._server_to_local(fixes_server_to_local=fixes_server_to_local)
+        local_po_path = self._server_to_local_po_path(project_name=project_name, root_path=root_path,
+                                                      fixes_server_to_local=fixes_server_to_local)
         log.debug("Local po path:{local_po}".format(local_po=str(local_po_path)))
 
-        if not local_po_path.exists():
+        if not await asyncio.to_thread(local_po_path.exists):
             log.debug("Language {server} was not local yet.".format(server=self.server()))
             log.debug("Moving downloaded po file to local.")
-            local_po_path.parent.mkdir(exist_ok=True)
-            pathlib.Path(server_po_path).rename(local_po_path)
+            await asyncio.to_thread(local_po_path.parent.mkdir, exist_ok=True)
+            # The export is stored in the temporary directory, which can live on another file system.
+            await asyncio.to_thread(shutil.move, str(server_po_path), str(local_po_path))
             self.set_local(local=local)
         else:
             log.debug("Language {server} is already local.".format(server=self.server()))
             log.debug("Merging downloaded translations into local translations ...")
             # check_call(["msgmerge", "--previous", "-U", str(local_po_path), server_po_file])
-            check_call(["msgmerge", str(server_po_path), str(local_po_path), "-o", str(local_po_path)])
+            args = ["msgmerge", str(server_po_path), str(local_po_path), "-o", str(local_po_path)]
+            process = await asyncio.create_subprocess_exec(*args)
+            returncode = await process.wait()
+            await asyncio.to_thread(server_po_path.unlink)
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, args)
             log.debug("... merging done!")
+        if self._server_updated:
+            await asyncio.to_thread(os.utime, str(local_po_path),
+                                    (datetime.datetime.now().timestamp(), self._server_updated.timestamp()))
         return True
 
-    def _server_to_name(self, api, server):
+    def _server_to_name(self, server_to_name, server):
         try:
-            available_languages = api.available_languages()
-            server_language = next(name_server for name_server in available_languages.items() if name_server[1] == server)
-            return server_language[0]
-        except StopIteration:
+            return server_to_name[server]
+        except KeyError:
             raise KeyError("Server does not know about language {server}".format(server=server))
 
-    def sync_to_server(self, api, project_id, project_name, root_path, fixes):
+    def is_synced_to_server(self, upload, digest):
+        # The po file did not change since it was uploaded, and nobody changed the translation on the server since.
+        if not self.server() or not upload or not self._server_updated:
+            return False
+        return upload["digest"] == digest and self._server_updated.timestamp() <= upload["time"]
+
+    async def sync_to_server(self, api, project_id, project_name, root_path, fixes_local_to_server, uploads,
+                             force=False):
         log.debug("Mapping.sync_to_server(local={local}) ...".format(local=self.local()))
         if not self.local():
             raise ValueError("Cannot sync to server if language is not local")
         local_po_path = (root_path / self.local() / project_name).with_suffix(".po")
         log.debug("Local po path:{local_po}".format(local_po=str(local_po_path)))
+        digest = await asyncio.to_thread(po_digest, local_po_path)
+        if not force and self.is_synced_to_server(uploads.get(self.server()), digest):
+            log.debug("Translation {server} did not change since last upload. Skipping.".format(server=self.server()))
+            return True
         if not self.server():
             log.debug("Language {local} is not on the server yet.".format(local=self.local()))
-            server = self._local_to_server(fixes=fixes)
+            server = self._local_to_server(fixes_local_to_server=fixes_local_to_server)
             log.debug("Creating {server} on server ...".format(server=server))
             try:
-                api.add_language_to_project(project_id=project_id, language_code=server)
+                await _call_api(api.add_language_to_project, project_id=project_id, language_code=server)
             except poeditor.POEditorException:
                 log.error("server AND fixes does not know about language {server}".format(server=server))
                 return False
             log.debug("... Language {server} created created on server".format(server=server))
             try:
-                name = self._server_to_name(api, server)
+                name = self._server_to_name(await _call_api(server_to_name_map, api), server)
             except KeyError:
                 log.warning("server does not know about language {server}".format(server=server))
                 return False
             self.set_server(server=server, name=name)
 
         log.debug("Uploading translation {server} to server ...".format(server=self.server()))
-        api.update_terms_definitions(project_id=project_id, language_code=self.server(), file_path=str(local_po_path),
-                                     overwrite=True, sync_terms=True)
+        await _call_api(api.update_terms_definitions, project_id=project_id, language_code=self.server(),
+                        file_path=str(local_po_path), overwrite=True, sync_terms=True, executor=_upload_executor)
+        uploads[self.server()] = {"digest": digest, "time": time.time()}
         log.debug("... Upload finished")
         return True
 
-    def delete_on_server(self, api, project_id):
+    async def delete_on_server(self, api, project_id, uploads):
         log.debug("Mapping.delete_on_server({server})".format(server=self.server()))
         if self.server():
             log.debug("Sending delete request ...")
-            api.delete_language_from_project(project_id=project_id, language_code=self.server())
+            await _call_api(api.delete_language_from_project, project_id=project_id, language_code=self.server())
+            uploads.pop(self.server(), None)
             log.debug("... delete done!")
             self.set_server(server=None, name=None)
             return True
         return False
 
-    FORMAT_STR = "{local:>8} {local_avail:>1} {server_avail:>1} {server:7} {name:21} {completed:>5} {updated}"
-
     def table_str(self):
-        local = self.local() if self.local() else ""
-        server = self.server() if self.server() else ""
+        local = self._local or ""
+        server = self._server or ""
         local_avail = "x" if local else " "
         server_avail = "x" if server else " "
-        name = self.name() if self.name() else ""
-        completed = "{:>3.1f}".format(self._server_completed if self._server_completed else 0)
-        updated = datetime.datetime.strftime(self._server_updated, "%Y-%m-%d %H:%M:%S") if self._server_updated else ""
-        return self.FORMAT_STR.format(local=local, local_avail=local_avail,
-                                      server_avail=server_avail, server=server,
-                                      name=name, completed=completed, updated=updated)
+        name = self._name or ""
+        completed = self._server_completed or 0
+        updated = f"{self._server_updated:%Y-%m-%d %H:%M:%S}" if self._server_updated else ""
+        return f"{local:>8} {local_avail:>1} {server_avail:>1} {server:7} {name:21} {completed:>5.1f} {updated}"
 
     @classmethod
     def table_header(cls):
-        return cls.FORMAT_STR.format(local="local", local_avail="L",
-                                     server_avail="S", server="server",
-                                     name="name", completed="%", updated="updated")
+        return f"{'local':>8} {'L':>1} {'S':>1} {'server':7} {'name':21} {'%':>5} updated"
+
+
+_SORT_ORDERS = "lsnpt"
+
+_SORT_KEYS = {
+    "l": lambda m: m.local() or "",
+    "s": lambda m: m.server() or "",
+    "n": lambda m: m.name() or "",
+    "p": lambda m: m.progress() or 0.0,
+    "t": lambda m: m.updated() or datetime.datetime.fromtimestamp(0, datetime.timezone.utc),
+}
 
 
 class Mappings:
     def __init__(self, project_name, project_id, language_root_path, fixes):
         self._mappings = []
+        self._index = {}
         self._project_name = project_name
         self._project_id = project_id
         self._language_root_path = language_root_path
-        self._fixes = fixes
+        # A fix maps a local code to a server code. Either code can be looked up.
+        self._fixes_local_to_server = {}
+        self._fixes_server_to_local = {}
+        for local, server in fixes.items():
+            self._fixes_local_to_server.setdefault(local, server)
+            self._fixes_local_to_server.setdefault(server, server)
+            self._fixes_server_to_local.setdefault(local, local)
+            self._fixes_server_to_local.setdefault(server, local)
+        # Local codes of the fixes that either code of a fix points to, in the order of the fixes
+        self._fixes_code_to_locals = {}
+        for local, server in fixes.items():
+            for code in {local.lower(), server.lower()}:
+                self._fixes_code_to_locals.setdefault(code, []).append(local)
 
     @classmethod
-    def from_project_name(cls, api, project_name, language_root_path, fixes):
+    def from_project_name(cls, api, project_name, language_root_path, local_languages_paths, fixes, use_cache=False):
         project_id = project_name_to_id(api, project_name)
         if project_id is None:
             log.error("Server does not have project {project_name}".format(project_name=project_name))
             raise KeyError("Illegal project name {project_name}".format(project_name=project_name))
 
-        local_languages_paths = [f for f in language_root_path .iterdir() if f.is_dir()]
-
         mappings = cls(project_name=project_name, project_id=project_id,
                        language_root_path=language_root_path, fixes=fixes)
         for local_language_path in local_languages_paths:
             mappings.add_mapping(Mapping.create_local(local=local_language_path.name))
 
-        server_languages = api.list_project_languages(project_id=project_id)
+        server_languages = list_project_languages(api, project_id=project_id, use_cache=use_cache)
 
         for server in server_languages:
             try:
                 mapping = mappings.get_mapping(server["code"])
                 mapping.set_server(server=server["code"], name=server["name"],
                                    server_completed=server["percentage"], server_updated=server["updated"])
+                mappings._index_mapping(mapping)
             except KeyError:
                 mapping = Mapping.create_server(server=server["code"], name=server["name"])
                 mappings.add_mapping(mapping)
+
+        mappings._add_fix_aliases(fixes)
         return mappings
 
-    def get_mapping(self, code):
-        def find_mapping(c):
-            for mapping in self._mappings:
-                if mapping.matches_code(c):
-                    return mapping
-            return None
+    def _find_mapping(self, code):
+        return self._index.get(_norm_local(code)) or self._index.get(_norm_server(code))
+
+    def _find_local_mapping(self, local):
+        mapping = self._index.get(_norm_local(local))
+        if mapping and mapping._local_norm == _norm_local(local):
+            return mapping
+        return None
 
-        mapping = find_mapping(code)
+    def get_mapping(self, code):
+        mapping = self._find_mapping(code)
         if mapping:
             return mapping
 
-        code = code.lower()
-        for key, value in self._fixes.items():
-            if key.lower() == code or value.lower() == code:
-                mapping = find_mapping(key)
-                if mapping:
-                    return mapping
+        # A fix only joins a local language that is not joined with another server language yet.
+        for local in self._fixes_code_to_locals.get(code.lower(), []):
+            mapping = self._find_local_mapping(local)
+            if mapping and not mapping.server():
+                return mapping
         raise KeyError("code unknown")
 
+    def _add_fix_aliases(self, fixes):
+        # A local language that is not on the server yet can also be selected by the server code of its fix,
+        # as long as no other language owns that server code.
+        for local, server in fixes.items():
+            mapping = self._find_local_mapping(local)
+            if mapping and not mapping.server() and not self._find_mapping(server):
+                mapping.add_aliases([server])
+
+    def _index_mapping(self, mapping):
+        # The first mapping added for a code wins, like a linear search would.
+        if mapping._local_norm:
+            self._index.setdefault(mapping._local_norm, mapping)
+        if mapping._server_norm:
+            self._index.setdefault(mapping._server_norm, mapping)
+
     def add_mapping(self, mapping):
         self._mappings.append(mapping)
+        self._index_mapping(mapping)
 
     def iter(self, language_filter=None, sort_specs=None):
         if language_filter:
-            result = []
-            for mapping in self._mappings:
-                for f in language_filter:
-                    if mapping.matches_code(f):
-                        result.append(mapping)
-                        break
+            filter_norm = _norm_codes(language_filter)
+            result = [mapping for mapping in self._mappings if filter_norm & mapping._keys]
         else:
             result = list(self._mappings)
 
         # sort_order None or one of ["l", "s", "n", "p", "t"]
-        if "l" in sort_specs:
-            result.sort(key=lambda m : m.local() if m.local() else "")
-        elif "s" in sort_specs:
-            result.sort(key=lambda m : m.server() if m.server() else "")
-        elif "n" in sort_specs:
-            result.sort(key=lambda m : m.name() if m.name() else "")
-        elif "p" in sort_specs:
-            result.sort(key=lambda m : m.progress() if m.progress() else 0.0)
-        elif "t" in sort_specs:
-            result.sort(key=lambda m : m.updated() if m.updated() else datetime.datetime.fromtimestamp(0))
-
-        if "r" in sort_specs:
+        sort_specs = sort_specs or ""
+        sort_order = next((c for c in _SORT_ORDERS if c in sort_specs), None)
+        reverse = "r" in sort_specs
+        if sort_order:
+            result.sort(key=_SORT_KEYS[sort_order], reverse=reverse)
+        elif reverse:
             result.reverse()
 
         return result
 
     def print_table(self, language_filter, sort_specs):
-        result_list = [Mapping.table_header()]
-        nb_requested = 0
-        fails = []
-        for mapping in self.iter(language_filter=language_filter, sort_specs=sort_specs):
-            nb_requested += 1
-            result_list.append(mapping.table_str())
+        mappings = self.iter(language_filter=language_filter, sort_specs=sort_specs)
+        result_list = [Mapping.table_header()] + [mapping.table_str() for mapping in mappings]
         print("\n".join(result_list))
-        return nb_requested, fails
+        return len(mappings), []
 
-    def sync_from_server(self, api, language_filter, sort_specs, download_path):
-        nb_requested = 0
-        fails = []
-        for mapping in self.iter(language_filter=language_filter, sort_specs=sort_specs):
-            nb_requested += 1
-            result = mapping.sync_from_server(api=api, project_id=self._project_id, project_name=self._project_name,
-                                              root_path=self._language_root_path, fixes=self._fixes,
-                                              download_path=download_path)
-            if not result:
-                fails.append(mapping)
-        return  nb_requested, fails
+    @staticmethod
+    async def _gather(items, action):
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
-    def sync_to_server(self, api, language_filter, sort_specs):
-        nb_requested = 0
+        async def run(item):
+            async with semaphore:
+                return await action(item)
+
+        return await asyncio.gather(*[run(item) for item in items], return_exceptions=True)
+
+    @classmethod
+    async def _gather_mappings(cls, mappings, action):
+        results = await cls._gather(mappings, action)
         fails = []
-        for mapping in self.iter(language_filter=language_filter, sort_specs=sort_specs):
-            nb_requested += 1
-            result = mapping.sync_to_server(api=api, project_id=self._project_id, project_name=self._project_name,
-                                     root_path=self._language_root_path, fixes=self._fixes)
-            if not result:
+        for mapping, result in zip(mappings, results):
+            if isinstance(result, BaseException):
+                log.error("Language {code} failed: {error!r}".format(code=mapping.local() or mapping.server(),
+                                                                     error=result))
                 fails.append(mapping)
-        return nb_requested, fails
-
-    def delete_on_server(self, api, language_filter, sort_specs):
-        print("Are you sure you want to delete languages from the server?")
-        name = input("Enter the name of the project to confirm: ")
-        if name.lower() != self._project_name:
-            print("Wrong name. Canceling")
-            return
-        nb_requested = 0
-        fails = []
-        for mapping in self.iter(language_filter=language_filter, sort_specs=sort_specs):
-            nb_requested += 1
-            result = mapping.delete_on_server(api=api, project_id=self._project_id)
-            if not result:
+            elif not result:
                 fails.append(mapping)
-        return nb_requested, fails
+        return fails
+
+    async def _batch_export(self, api, codes):
+        log.debug("Fetching translations of {nb} languages from server ...".format(nb=len(codes)))
+        results = await self._gather(codes, lambda code: _call_api(
+            api.export, project_id=self._project_id, language_code=code, file_type="po"))
+        server_po_files = {}
+        for code, result in zip(codes, results):
+            if isinstance(result, BaseException):
+                log.error("Fetching translations of {code} failed: {error!r}".format(code=code, error=result))
+                continue
+            server_po_url, server_po_file = result
+            server_po_files[code] = server_po_file
+        log.debug("... Translations fetched!")
+        return server_po_files
+
+    async def sync_from_server(self, api, language_filter, sort_specs, download_path, force=False):
+        mappings = self.iter(language_filter=language_filter, sort_specs=sort_specs)
+        if download_path or force:
+            synced = [False] * len(mappings)
+        else:
+            synced = await asyncio.gather(*[asyncio.to_thread(
+                mapping.is_synced_from_server, project_name=self._project_name, root_path=self._language_root_path,
+                fixes_server_to_local=self._fixes_server_to_local) for mapping in mappings])
+        mappings_to_sync = []
+        for mapping, mapping_synced in zip(mappings, synced):
+            if mapping_synced:
+                log.debug("Language {server} did not change on server. Skipping.".format(server=mapping.server()))
+            else:
+                mappings_to_sync.append(mapping)
+
+        server_po_files = await self._batch_export(api, [mapping.server() for mapping in mappings_to_sync
+                                                         if mapping.server()])
+        fails = await self._gather_mappings(mappings_to_sync, lambda mapping: mapping.sync_from_server(
+            server_po_file=server_po_files.get(mapping.server()), project_name=self._project_name,
+            root_path=self._language_root_path, fixes_server_to_local=self._fixes_server_to_local,
+            download_path=download_path))
+        return len(mappings), fails
+
+    async def sync_to_server(self, api, language_filter, sort_specs, force=False):
+        mappings = self.iter(language_filter=language_filter, sort_specs=sort_specs)
+        uploads = load_uploads(self._project_id)
+        try:
+            fails = await self._gather_mappings(mappings, lambda mapping: mapping.sync_to_server(
+                api=api, project_id=self._project_id, project_name=self._project_name,
+                root_path=self._language_root_path, fixes_local_to_server=self._fixes_local_to_server,
+                uploads=uploads, force=force))
+        finally:
+            save_uploads(self._project_id, uploads)
+        invalidate_project_languages_cache(self._project_id)
+        return len(mappings), fails
+
+    async def delete_on_server(self, api, language_filter, sort_specs, confirmed=False):
+        if not confirmed:
+            print("Are you sure you want to delete languages from the server?")
+            name = input("Enter the name of the project to confirm: ")
+            if name.lower() != self._project_name:
+                print("Wrong name. Canceling")
+                return 0, []
+        mappings = self.iter(language_filter=language_filter, sort_specs=sort_specs)
+        uploads = load_uploads(self._project_id)
+        try:
+            fails = await self._gather_mappings(mappings, lambda mapping: mapping.delete_on_server(
+                api=api, project_id=self._project_id, uploads=uploads))
+        finally:
+            save_uploads(self._project_id, uploads)
+        invalidate_project_languages_cache(self._project_id)
+        return len(mappings), fails
 
 
 def project_name_to_id(api, project_name):
-    projects = api.list_projects()
+    with _cache_lock:
+        projects = _cached_list_projects(api)
     try:
         project = next(p for p in projects if p["name"].lower() == project_name)
     except StopIteration:
@@ -335,6 +544,72 @@ def project_name_to_id(api, project_name):
     return project["id"]
 
 
+def _project_languages_cache_path(project_id):
+    return CACHE_PATH / "{project_id}-langs.json".format(project_id=project_id)
+
+
+def list_project_languages(api, project_id, use_cache):
+    cache_path = _project_languages_cache_path(project_id)
+    if use_cache:
+        try:
+            if time.time() - cache_path.stat().st_mtime < SERVER_LANGUAGES_CACHE_TIMEOUT:
+                with cache_path.open() as f:
+                    server_languages = json.load(f)
+                for server in server_languages:
+                    if server.get("updated"):
+                        server["updated"] = datetime.datetime.fromisoformat(server["updated"])
+                log.debug("Using cached languages of project {project_id}".format(project_id=project_id))
+                return server_languages
+        except (OSError, ValueError):
+            pass
+
+    server_languages = api.list_project_languages(project_id=project_id)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with cache_path.open("w") as f:
+            json.dump(server_languages, f, default=lambda o: o.isoformat())
+    except OSError:
+        log.warning("Could not cache languages of project {project_id}".format(project_id=project_id))
+    return server_languages
+
+
+def invalidate_project_languages_cache(project_id):
+    try:
+        _project_languages_cache_path(project_id).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def po_digest(path):
+    with path.open("rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "blake2b").hexdigest()
+        return hashlib.blake2b(f.read()).hexdigest()
+
+
+def _uploads_path(project_id):
+    return CACHE_PATH / "{project_id}-uploaded.json".format(project_id=project_id)
+
+
+def load_uploads(project_id):
+    # Digest of the po file and time of the last upload, by server language code
+    try:
+        with _uploads_path(project_id).open() as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_uploads(project_id, uploads):
+    cache_path = _uploads_path(project_id)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with cache_path.open("w") as f:
+            json.dump(uploads, f)
+    except OSError:
+        log.warning("Could not store uploads of project {project_id}".format(project_id=project_id))
+
+
 def format_fails(fails):
     return ",".join([fail.local() or fail.server() for fail in fails])
 
@@ -348,6 +623,9 @@ if __name__ == "__main__":
     parser.add_argument("--sort", "-s", dest="sort_order", default=None, choices=["l", "s", "n", "p", "t"], help="sort order")
     parser.add_argument("--reverse", "-r", dest="reverse_order", action="store_true", help="reverse order")
 
+    parser.add_argument("--yes", "-y", dest="yes", action="store_true", help="do not ask for confirmation")
+    parser.add_argument("--force", dest="force", action="store_true",
+                        help="also download/upload languages that did not change since the last sync")
     parser.add_argument("--folder", "-f", dest="folder", default=None, help="define folder where downloaded files will be stored")
 
     download_upload = parser.add_mutually_exclusive_group(required=True)
@@ -372,36 +650,42 @@ if __name__ == "__main__":
         path_poeditor_fixes = args.poeditor_fixes
     else:
         path_poeditor_fixes = str(file_path / "poeditor_fixes")
-    poeditor_fixes = ast.literal_eval(open(path_poeditor_fixes).read())
+    with open(path_poeditor_fixes) as f:
+        poeditor_fixes = ast.literal_eval(f.read())
 
     language_filter = args.language_filter
 
     sort_specs = ("r" if args.reverse_order else "") + (args.sort_order if args.sort_order else "")
 
     language_root_path = file_path / project_name
-    local_languages_paths = [f for f in language_root_path .iterdir() if f.is_dir()]
+    with os.scandir(str(language_root_path)) as entries:
+        local_languages_paths = [pathlib.Path(entry.path) for entry in entries if entry.is_dir()]
 
     folder_path = pathlib.Path(args.folder) if args.folder is not None else None
 
+    share_http_session()
     poeditor_api = poeditor.POEditorAPI(api_token=api_token, block_upload=True)
 
     mappings = Mappings.from_project_name(api=poeditor_api, project_name=project_name,
-                                          language_root_path=language_root_path, fixes=poeditor_fixes)
+                                          language_root_path=language_root_path,
+                                          local_languages_paths=local_languages_paths, fixes=poeditor_fixes,
+                                          use_cache=args.status)
 
     if args.status:
         nb_requested, fails = mappings.print_table(language_filter=language_filter, sort_specs=sort_specs)
 
     elif args.download:
-        nb_requested, fails = mappings.sync_from_server(api=poeditor_api, language_filter=language_filter,
-                                                        sort_specs=sort_specs, download_path=folder_path)
+        nb_requested, fails = asyncio.run(mappings.sync_from_server(api=poeditor_api, language_filter=language_filter,
+                                                                    sort_specs=sort_specs, download_path=folder_path,
+                                                                    force=args.force))
 
     elif args.upload:
-        nb_requested, fails = mappings.sync_to_server(api=poeditor_api, language_filter=language_filter,
-                                                      sort_specs=sort_specs)
+        nb_requested, fails = asyncio.run(mappings.sync_to_server(api=poeditor_api, language_filter=language_filter,
+                                                                  sort_specs=sort_specs, force=args.force))
 
     elif args.delete:
-        nb_requested, fails = mappings.delete_on_server(api=poeditor_api, language_filter=language_filter,
-                                                        sort_specs=sort_specs)
+        nb_requested, fails = asyncio.run(mappings.delete_on_server(api=poeditor_api, language_filter=language_filter,
+                                                                    sort_specs=sort_specs, confirmed=args.yes))
 
     else:
         parser.error("Need command")